@@ -0,0 +1,38 @@
+import os
+import cv2
+
+# Create directories for uploaded and processed videos
+UPLOAD_DIR = "uploaded_videos"
+PROCESSED_DIR = "processed_videos"
+DEMO_DIR = "demo_videos"  # Directory for pre-processed demo videos
+
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+os.makedirs(PROCESSED_DIR, exist_ok=True)
+os.makedirs(DEMO_DIR, exist_ok=True)
+
+# Output encoder: hardware-accelerated H.264 where available, with the
+# software MPEG-4 encoder as a fallback
+ENCODER_FOURCC = "avc1"
+ENCODER_HWACCEL = cv2.VIDEO_ACCELERATION_ANY
+FALLBACK_FOURCC = "mp4v"
+
+# Minimum time in seconds between progress updates sent to the UI
+PROGRESS_INTERVAL = 0.1
+
+# Index of demo results keyed by upload content
+DEMO_CACHE_FILE = os.path.join(DEMO_DIR, "cache.json")
+
+# When generating the default demo video, only every Nth frame is retrieved
+DEMO_FRAME_STRIDE = 2
+
+# Number of processing requests Gradio runs at the same time
+N_WORKERS = max(1, min(4, (os.cpu_count() or 2) // 2))
+
+# Weights of the original frame and the edge overlay in the blend
+FRAME_WEIGHT = 0.7
+EDGE_WEIGHT = 0.3
+
+# Frames larger than this (on their longest side) have their edges detected
+# at EDGE_DOWNSCALE resolution and upsampled; the overlay looks the same
+EDGE_DOWNSCALE_ABOVE = 960
+EDGE_DOWNSCALE = 0.5